@@ -7,45 +7,80 @@ with best practices guidance at each step of the process using the OpenAI Agents
 """
 
 import os
-import json
+import sys
+import orjson
 import re
 import asyncio
+import functools
+import hashlib
+import shelve
+import time
+import threading
+import argparse
+import textwrap
 from typing import Dict, Any, List, Optional, Callable
-from pydantic import BaseModel, Field
+import httpx
+from pydantic import BaseModel, Field, ValidationError
 
 # Import the OpenAI Agents SDK
-from agents import Agent, Runner, handoff, RunContextWrapper, function_tool
+from agents import Agent, Runner, RunConfig, ModelSettings, handoff, RunContextWrapper, function_tool, set_default_openai_client, MaxTurnsExceeded
+from agents.run import DEFAULT_MAX_TURNS
+from openai import AsyncOpenAI
+from openai.types.responses import ResponseTextDeltaEvent
 
 # Define the API specification template
-API_SPEC_TEMPLATE = {
-    "openapi": "3.0.0",
-    "info": {
-        "title": "API Specification",
-        "description": "REST API based on user requirements",
-        "version": "1.0.0"
-    },
-    "servers": [
-        {
-            "url": "https://api.example.com/v1",
-            "description": "Production server"
+def new_api_spec() -> Dict:
+    """Build a fresh API specification template, so nested sections are never shared between runs"""
+    return {
+        "openapi": "3.0.0",
+        "info": {
+            "title": "API Specification",
+            "description": "REST API based on user requirements",
+            "version": "1.0.0"
         },
-        {
-            "url": "https://staging-api.example.com/v1",
-            "description": "Staging server"
-        }
-    ],
-    "paths": {},
-    "components": {
-        "schemas": {},
-        "securitySchemes": {
-            "BearerAuth": {
-                "type": "http",
-                "scheme": "bearer",
-                "bearerFormat": "JWT"
+        "servers": [
+            {
+                "url": "https://api.example.com/v1",
+                "description": "Production server"
+            },
+            {
+                "url": "https://staging-api.example.com/v1",
+                "description": "Staging server"
+            }
+        ],
+        "paths": {},
+        "components": {
+            "schemas": {},
+            "securitySchemes": {
+                "BearerAuth": {
+                    "type": "http",
+                    "scheme": "bearer",
+                    "bearerFormat": "JWT"
+                }
             }
         }
     }
-}
+
+# Models used to validate the JSON that agents pass to the save tools
+class SpecInfo(BaseModel):
+    """The info section of an OpenAPI specification"""
+    title: str
+    description: str = ""
+    version: str
+
+class SpecComponents(BaseModel):
+    """The components section of an OpenAPI specification"""
+    schemas: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+
+class EndpointsSpec(BaseModel):
+    """An OpenAPI paths object wrapped in a 'paths' property"""
+    paths: Dict[str, Dict[str, Any]]
+
+class OpenAPISpec(EndpointsSpec):
+    """A complete OpenAPI specification"""
+    openapi: str
+    info: SpecInfo
+    components: SpecComponents = Field(default_factory=SpecComponents)
 
 # ANSI color codes for better terminal output
 class Colors:
@@ -59,19 +94,30 @@ class Colors:
     UNDERLINE = '\033[4m'
     END = '\033[0m'
 
+# Drop the escape codes when output is redirected to a file or CI log
+if not sys.stdout.isatty():
+    for color in [name for name in vars(Colors) if not name.startswith("_")]:
+        setattr(Colors, color, "")
+
 # Utility functions for saving and loading data
 def save_to_file(data: Any, filename: str) -> str:
     """Save data to a JSON file"""
+    with open(filename, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    return f"Data saved to {filename}"
+
+def save_text_to_file(text: str, filename: str) -> str:
+    """Save text to a file as-is"""
     with open(filename, "w") as f:
-        json.dump(data, f, indent=2)
+        f.write(text)
     return f"Data saved to {filename}"
 
 def load_from_file(filename: str) -> Any:
     """Load data from a JSON file"""
     try:
-        with open(filename, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
+        with open(filename, "rb") as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
         return None
 
 def print_section_header(title: str):
@@ -80,46 +126,188 @@ def print_section_header(title: str):
 
 def print_best_practices(practices: List[str]):
     """Print a list of best practices"""
-    print(f"{Colors.CYAN}{Colors.BOLD}Best Practices:{Colors.END}")
-    for practice in practices:
-        print(f"{Colors.CYAN}• {practice}{Colors.END}")
-    print()
+    lines = [f"{Colors.CYAN}{Colors.BOLD}Best Practices:{Colors.END}"]
+    lines.extend(f"{Colors.CYAN}• {practice}{Colors.END}" for practice in practices)
+    print("\n".join(lines) + "\n")
+
+_FENCE = "```"
+# Only braces, quotes and escape pairs affect the brace depth, so the regex skips everything else in C
+_JSON_TOKEN_RE = re.compile(r'\\.|[{}"]', re.DOTALL)
+
+def iter_fenced_blocks(text: str):
+    """Yield the contents of each markdown code block in a single linear pass"""
+    pos = 0
+    while True:
+        start = text.find(_FENCE, pos)
+        if start == -1:
+            return
+        start += len(_FENCE)
+        end = text.find(_FENCE, start)
+        if end == -1:
+            return
+        block = text[start:end]
+        if block.startswith("json"):
+            block = block[len("json"):]
+        yield block.strip()
+        pos = end + len(_FENCE)
+
+def iter_balanced_objects(text: str):
+    """Yield each top-level balanced {...} span in text, tracking strings and escapes"""
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        in_string = False
+        for match in _JSON_TOKEN_RE.finditer(text, start):
+            token = match.group()
+            if token[0] == "\\":
+                # Escaped character, always inside a string
+                continue
+            if in_string:
+                if token == '"':
+                    in_string = False
+            elif token == '"':
+                in_string = True
+            elif token == "{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    end = match.end()
+                    yield text[start:end]
+                    break
+        else:
+            # Unbalanced from here to the end of the text
+            return
+        # Resume after the span so nested objects of an invalid candidate are never tried
+        start = text.find("{", end)
 
 def extract_json_from_text(text: str) -> Optional[Dict]:
     """Extract JSON from text that might contain markdown code blocks"""
+    # The common case is a bare JSON response
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
+    
     # Look for JSON in markdown code blocks
-    json_pattern = r"```(?:json)?\s*([\s\S]*?)```"
-    matches = re.findall(json_pattern, text)
-    
-    if matches:
-        for match in matches:
-            try:
-                return json.loads(match.strip())
-            except json.JSONDecodeError:
-                continue
+    for block in iter_fenced_blocks(text):
+        try:
+            return orjson.loads(block)
+        except orjson.JSONDecodeError:
+            continue
     
-    # If no valid JSON in code blocks, try to extract JSON directly
-    try:
-        # Try to parse the entire text as JSON
-        return json.loads(text)
-    except json.JSONDecodeError:
-        # Try to find JSON-like content with curly braces
+    # Try to find JSON-like content with curly braces
+    for candidate in iter_balanced_objects(text):
         try:
-            json_like_pattern = r"\{[\s\S]*\}"
-            json_match = re.search(json_like_pattern, text)
-            if json_match:
-                return json.loads(json_match.group(0))
-        except (json.JSONDecodeError, AttributeError):
-            pass
+            return orjson.loads(candidate)
+        except orjson.JSONDecodeError:
+            continue
     
     return None
 
-# Create the specialized agents using the OpenAI Agents SDK
-def create_requirements_agent():
-    """Create an agent specialized in gathering and clarifying API requirements"""
-    return Agent(
-        name="Requirements Agent",
-        instructions="""
+HTTP_METHODS = ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+
+def iter_schema_refs(node: Any):
+    """Yield the name of every schema referenced with $ref inside a spec fragment"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "$ref" and isinstance(value, str):
+                yield value.rsplit("/", 1)[-1]
+            else:
+                yield from iter_schema_refs(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from iter_schema_refs(item)
+
+def summarize_endpoints(endpoints: Dict) -> str:
+    """Build a compact one-line-per-operation digest of the endpoints for use in prompts"""
+    # The endpoints come from model output, so treat null or malformed fields as empty
+    paths = (endpoints.get("paths") if isinstance(endpoints, dict) else None) or {}
+    if not isinstance(paths, dict):
+        paths = {}
+    lines = []
+    for path, operations in paths.items():
+        if not isinstance(operations, dict):
+            continue
+        for method, operation in operations.items():
+            if method.lower() not in HTTP_METHODS or not isinstance(operation, dict):
+                continue
+            parameters = operation.get("parameters") or []
+            params = [str(param["name"]) for param in parameters if isinstance(param, dict) and "name" in param] if isinstance(parameters, list) else []
+            responses = operation.get("responses") or {}
+            responses = [str(code) for code in responses] if isinstance(responses, dict) else []
+            schemas = sorted(set(iter_schema_refs(operation)))
+            lines.append(
+                f"{method.upper()} {path} - {operation.get('summary') or ''} "
+                f"(params: {', '.join(params) or 'none'}; responses: {', '.join(responses) or 'none'}; "
+                f"schemas: {', '.join(schemas) or 'none'})"
+            )
+    return "\n".join(lines) or "No endpoints were designed."
+
+# On-disk cache of agent responses so reruns with identical prompts skip the API call
+RESPONSE_CACHE_FILE = "agent_cache"
+RESPONSE_CACHE_TTL = 3600
+response_cache_enabled = True
+
+# Print one progress dot per this many characters of streamed output
+STREAM_PROGRESS_CHARS = 200
+
+# The coordinator's feedback is only printed, so keep those generations short and focused
+FEEDBACK_RUN_CONFIG = RunConfig(model_settings=ModelSettings(max_tokens=256, temperature=0.3))
+
+async def run_agent(agent: Agent, prompt: str, stream: bool = False, run_config: Optional[RunConfig] = None,
+                    max_turns: int = DEFAULT_MAX_TURNS) -> str:
+    """Run an agent and return its final output, optionally streaming progress to the terminal"""
+    if not stream:
+        result = await Runner.run(agent, prompt, run_config=run_config, max_turns=max_turns)
+        return result.final_output
+    
+    result = Runner.run_streamed(agent, prompt, run_config=run_config, max_turns=max_turns)
+    received = 0
+    async for event in result.stream_events():
+        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+            received += len(event.data.delta)
+            while received >= STREAM_PROGRESS_CHARS:
+                print(f"{Colors.CYAN}.{Colors.END}", end="", flush=True)
+                received -= STREAM_PROGRESS_CHARS
+    print()
+    return result.final_output
+
+# shelve does not support concurrent writers, so worker threads take turns on the cache file
+response_cache_lock = threading.Lock()
+
+def read_cache_entry(key: str) -> Optional[Dict]:
+    """Read one entry from the response cache"""
+    with response_cache_lock, shelve.open(RESPONSE_CACHE_FILE) as cache:
+        return cache.get(key)
+
+def write_cache_entry(key: str, output: str) -> None:
+    """Write one entry to the response cache"""
+    with response_cache_lock, shelve.open(RESPONSE_CACHE_FILE) as cache:
+        cache[key] = {"output": output, "timestamp": time.time()}
+
+async def cached_run(agent: Agent, prompt: str, ttl: int = RESPONSE_CACHE_TTL, stream: bool = False,
+                     run_config: Optional[RunConfig] = None, max_turns: int = DEFAULT_MAX_TURNS) -> str:
+    """Run an agent and return its final output, reusing a cached response for an identical prompt"""
+    # Tools write the generated artifacts, so agents with tools must always run to keep the output files consistent
+    if not response_cache_enabled or agent.tools:
+        return await run_agent(agent, prompt, stream, run_config, max_turns)
+    
+    # Include the instructions so editing an agent invalidates its cached responses
+    key = hashlib.sha256((agent.name + agent.instructions + prompt).encode()).hexdigest()
+    
+    # Access the cache file from a worker thread so it does not block concurrent agent calls
+    entry = await asyncio.to_thread(read_cache_entry, key)
+    if entry and time.time() - entry["timestamp"] < ttl:
+        return entry["output"]
+    
+    output = await run_agent(agent, prompt, stream, run_config, max_turns)
+    await asyncio.to_thread(write_cache_entry, key, output)
+    return output
+
+# Agent instructions are kept as frozen, whitespace-normalized constants so the
+# system prompt is byte-identical on every call and hits OpenAI's automatic prefix cache
+REQUIREMENTS_INSTRUCTIONS = textwrap.dedent("""
         You are a Requirements Gathering Agent specialized in collecting and clarifying API requirements.
         Format your response as a structured document covering:
         1. Purpose - What the API is for and what problem it solves
@@ -132,15 +320,9 @@ def create_requirements_agent():
         8. Error Handling - How errors should be handled
         
         Be thorough but concise. Use markdown formatting for better readability.
-        """,
-        tools=[save_requirements]
-    )
+        """).strip()
 
-def create_architect_agent():
-    """Create an agent specialized in designing API architecture"""
-    return Agent(
-        name="Architect Agent",
-        instructions="""
+ARCHITECT_INSTRUCTIONS = textwrap.dedent("""
         You are an API Architect specialized in designing high-level API structures.
         Format your response as a structured document including:
         1. Resource Hierarchy - Main resources and their relationships
@@ -153,15 +335,9 @@ def create_architect_agent():
         8. Caching - Caching recommendations
         
         Follow RESTful best practices. Use markdown formatting for better readability.
-        """,
-        tools=[save_architecture]
-    )
+        """).strip()
 
-def create_endpoint_designer_agent():
-    """Create an agent specialized in designing detailed API endpoints"""
-    return Agent(
-        name="Endpoint Designer Agent",
-        instructions="""
+ENDPOINT_DESIGNER_INSTRUCTIONS = textwrap.dedent("""
         You are an Endpoint Designer specialized in creating detailed API endpoint specifications.
         
         For each endpoint, provide a complete OpenAPI 3.0 specification including:
@@ -177,15 +353,9 @@ def create_endpoint_designer_agent():
         
         Format your response as a JSON object with a "paths" property containing all endpoints.
         Wrap your JSON in ```json and ``` markers.
-        """,
-        tools=[save_endpoints]
-    )
+        """).strip()
 
-def create_schema_designer_agent():
-    """Create an agent specialized in designing data schemas"""
-    return Agent(
-        name="Schema Designer Agent",
-        instructions="""
+SCHEMA_DESIGNER_INSTRUCTIONS = textwrap.dedent("""
         You are a Schema Designer specialized in creating detailed data schemas for APIs.
         
         For each data model in the API, provide a complete OpenAPI 3.0 schema including:
@@ -199,15 +369,9 @@ def create_schema_designer_agent():
         
         Format your response as a JSON object containing all schemas.
         Wrap your JSON in ```json and ``` markers.
-        """,
-        tools=[save_openapi_spec]
-    )
+        """).strip()
 
-def create_documentation_agent():
-    """Create an agent specialized in generating comprehensive documentation"""
-    return Agent(
-        name="Documentation Agent",
-        instructions="""
+DOCUMENTATION_INSTRUCTIONS = textwrap.dedent("""
         You are a Documentation Specialist who creates comprehensive API documentation.
         
         Create detailed markdown documentation that includes:
@@ -228,15 +392,27 @@ def create_documentation_agent():
         
         Use markdown formatting for better readability.
         Include code blocks with examples for all API calls.
-        """,
-        tools=[save_documentation]
-    )
+        Use the read_spec_slice tool to fetch the full definition of each endpoint and
+        the read_schema tool to fetch the schemas it references.
+        """).strip()
 
-def create_coordinator_agent():
-    """Create a coordinator agent to guide the API design process"""
-    return Agent(
-        name="Coordinator Agent",
-        instructions="""
+FINALIZER_INSTRUCTIONS = textwrap.dedent("""
+        You are a Finalizer Agent who completes an API specification and its documentation in a single response.
+        
+        Given the requirements, architecture and endpoints of an API, produce:
+        1. schemas - A complete OpenAPI 3.0 'schemas' object for every data model, with types, formats,
+           required fields, descriptions for all properties and an 'example' property with realistic sample data
+        2. info - A concise API 'title' and 'description' for the OpenAPI specification
+        3. documentation_md - Comprehensive markdown documentation covering the introduction, authentication,
+           base URL, resources, every endpoint with at least 2 complete request and response examples,
+           error handling, rate limiting, pagination and common use cases
+        
+        Your output must be a single valid JSON object of the form:
+        {"schemas": {...}, "info": {"title": "...", "description": "..."}, "documentation_md": "..."}
+        Wrap your JSON in ```json and ``` markers.
+        """).strip()
+
+COORDINATOR_INSTRUCTIONS = textwrap.dedent("""
         You are a Coordinator Agent who guides users through the API design process.
         
         Your responsibilities include:
@@ -247,57 +423,150 @@ def create_coordinator_agent():
         5. Helping users understand each phase of the API design process
         
         Be helpful, informative, and focused on creating a high-quality API specification.
-        """,
+        """).strip()
+
+# Create the specialized agents using the OpenAI Agents SDK
+# Agents are stateless, so each one is built once and reused across phases
+@functools.lru_cache(maxsize=1)
+def create_requirements_agent():
+    """Create an agent specialized in gathering and clarifying API requirements"""
+    return Agent(
+        name="Requirements Agent",
+        instructions=REQUIREMENTS_INSTRUCTIONS,
+        tools=[save_requirements]
+    )
+
+@functools.lru_cache(maxsize=1)
+def create_architect_agent():
+    """Create an agent specialized in designing API architecture"""
+    return Agent(
+        name="Architect Agent",
+        instructions=ARCHITECT_INSTRUCTIONS,
+        tools=[save_architecture]
+    )
+
+@functools.lru_cache(maxsize=1)
+def create_endpoint_designer_agent():
+    """Create an agent specialized in designing detailed API endpoints"""
+    return Agent(
+        name="Endpoint Designer Agent",
+        instructions=ENDPOINT_DESIGNER_INSTRUCTIONS,
+        tools=[save_endpoints]
+    )
+
+@functools.lru_cache(maxsize=1)
+def create_schema_designer_agent():
+    """Create an agent specialized in designing data schemas"""
+    return Agent(
+        name="Schema Designer Agent",
+        instructions=SCHEMA_DESIGNER_INSTRUCTIONS,
+        tools=[save_openapi_spec]
+    )
+
+@functools.lru_cache(maxsize=1)
+def create_documentation_agent():
+    """Create an agent specialized in generating comprehensive documentation"""
+    return Agent(
+        name="Documentation Agent",
+        instructions=DOCUMENTATION_INSTRUCTIONS,
+        tools=[save_documentation, read_spec_slice, read_schema]
+    )
+
+@functools.lru_cache(maxsize=1)
+def create_finalizer_agent():
+    """Create an agent that designs schemas, metadata and documentation in one call"""
+    return Agent(
+        name="Finalizer Agent",
+        instructions=FINALIZER_INSTRUCTIONS
+    )
+
+@functools.lru_cache(maxsize=1)
+def create_coordinator_agent():
+    """Create a coordinator agent to guide the API design process"""
+    return Agent(
+        name="Coordinator Agent",
+        instructions=COORDINATOR_INSTRUCTIONS,
         tools=[save_requirements, save_architecture, save_endpoints, save_openapi_spec, save_documentation]
     )
 
+@functools.lru_cache(maxsize=1)
+def create_feedback_coordinator_agent():
+    """Create a coordinator agent without tools for guidance and feedback that runs alongside other phases"""
+    return Agent(
+        name="Coordinator Agent",
+        instructions=COORDINATOR_INSTRUCTIONS
+    )
+
 # Define tool functions that will be used by the agents
 @function_tool
-def save_requirements(requirements: str) -> str:
+async def save_requirements(requirements: str) -> str:
     """Save the gathered requirements to a file"""
-    save_to_file({"requirements": requirements}, "api_requirements.json")
+    # Write from a worker thread so disk I/O does not block concurrent agent calls
+    await asyncio.to_thread(save_to_file, {"requirements": requirements}, "api_requirements.json")
     print(f"{Colors.GREEN}Requirements saved to api_requirements.json{Colors.END}")
     return "Requirements saved successfully"
 
 @function_tool
-def save_architecture(architecture: str) -> str:
+async def save_architecture(architecture: str) -> str:
     """Save the API architecture to a file"""
-    save_to_file({"architecture": architecture}, "api_architecture.json")
+    await asyncio.to_thread(save_to_file, {"architecture": architecture}, "api_architecture.json")
     print(f"{Colors.GREEN}Architecture saved to api_architecture.json{Colors.END}")
     return "Architecture saved successfully"
 
 @function_tool
-def save_endpoints(endpoints_json: str) -> str:
+async def save_endpoints(endpoints_json: str) -> str:
     """Save the API endpoints to a file"""
+    # Parse and validate in one pass, then write the agent's JSON through unchanged
+    endpoints_json = endpoints_json.strip()
     try:
-        endpoints = json.loads(endpoints_json)
-        save_to_file(endpoints, "api_endpoints.json")
-        print(f"{Colors.GREEN}Endpoints saved to api_endpoints.json{Colors.END}")
-        return "Endpoints saved successfully"
-    except json.JSONDecodeError:
+        EndpointsSpec.model_validate_json(endpoints_json)
+    except ValidationError as e:
         print(f"{Colors.RED}Error: Invalid JSON for endpoints{Colors.END}")
-        return "Error: Invalid JSON format"
+        return f"Error: Invalid endpoints JSON - {e}"
+    await asyncio.to_thread(save_text_to_file, endpoints_json, "api_endpoints.json")
+    print(f"{Colors.GREEN}Endpoints saved to api_endpoints.json{Colors.END}")
+    return "Endpoints saved successfully"
 
 @function_tool
-def save_openapi_spec(spec_json: str) -> str:
+async def save_openapi_spec(spec_json: str) -> str:
     """Save the complete OpenAPI specification to a file"""
+    spec_json = spec_json.strip()
     try:
-        spec = json.loads(spec_json)
-        save_to_file(spec, "openapi_specification.json")
-        print(f"{Colors.GREEN}OpenAPI specification saved to openapi_specification.json{Colors.END}")
-        return "OpenAPI specification saved successfully"
-    except json.JSONDecodeError:
+        OpenAPISpec.model_validate_json(spec_json)
+    except ValidationError as e:
         print(f"{Colors.RED}Error: Invalid JSON for OpenAPI specification{Colors.END}")
-        return "Error: Invalid JSON format"
+        return f"Error: Invalid OpenAPI specification - {e}"
+    await asyncio.to_thread(save_text_to_file, spec_json, "openapi_specification.json")
+    print(f"{Colors.GREEN}OpenAPI specification saved to openapi_specification.json{Colors.END}")
+    return "OpenAPI specification saved successfully"
 
 @function_tool
-def save_documentation(documentation: str) -> str:
+async def save_documentation(documentation: str) -> str:
     """Save the API documentation to a markdown file"""
-    with open("api_documentation.md", "w") as f:
-        f.write(documentation)
+    await asyncio.to_thread(save_text_to_file, documentation, "api_documentation.md")
     print(f"{Colors.GREEN}Documentation saved to api_documentation.md{Colors.END}")
     return "Documentation saved successfully"
 
+# The specification the documentation agent reads from, set before the agent runs
+current_api_spec: Dict = {}
+
+@function_tool
+def read_spec_slice(path: str, method: str) -> str:
+    """Return the full OpenAPI definition of one endpoint as JSON"""
+    operations = (current_api_spec.get("paths") or {}).get(path)
+    operation = operations.get(method.lower()) if isinstance(operations, dict) else None
+    if operation is None:
+        return f"Error: No {method.upper()} {path} endpoint in the specification"
+    return orjson.dumps(operation).decode()
+
+@function_tool
+def read_schema(name: str) -> str:
+    """Return the OpenAPI definition of one schema as JSON"""
+    schema = ((current_api_spec.get("components") or {}).get("schemas") or {}).get(name)
+    if schema is None:
+        return f"Error: No {name} schema in the specification"
+    return orjson.dumps(schema).decode()
+
 async def phase_1_requirements_gathering(user_input: str) -> str:
     """Phase 1: Requirements Gathering using the Requirements Agent"""
     print_section_header("Phase 1: Requirements Gathering")
@@ -325,8 +594,7 @@ async def phase_1_requirements_gathering(user_input: str) -> str:
     user_prompt = f"Gather detailed requirements for an API based on this description: {user_input}. Include best practices and recommendations."
     
     # Run the requirements agent
-    result = await Runner.run(requirements_agent, user_prompt)
-    requirements = result.final_output
+    requirements = await cached_run(requirements_agent, user_prompt)
     
     # Note: The save_requirements function will be called by the agent through the function_tool decorator
     # No need to call it manually here
@@ -364,8 +632,7 @@ async def phase_2_architecture_design(requirements: str) -> str:
     user_prompt = f"Design the architecture for an API with these requirements: {requirements}. Include best practices and recommendations."
     
     # Run the architect agent
-    result = await Runner.run(architect_agent, user_prompt)
-    architecture = result.final_output
+    architecture = await cached_run(architect_agent, user_prompt)
     
     # Note: The save_architecture function will be called by the agent through the function_tool decorator
     # No need to call it manually here
@@ -416,12 +683,12 @@ async def phase_3_endpoint_design(architecture: str) -> Dict:
     Wrap your JSON in ```json and ``` markers.
     """
     
-    # Run the endpoint designer agent
-    result = await Runner.run(endpoint_designer, user_prompt)
-    endpoints_text = result.final_output
+    # Run the endpoint designer agent, streaming progress while the paths are generated
+    endpoints_text = await cached_run(endpoint_designer, user_prompt, stream=True)
     
     # Try to extract JSON from the response
-    endpoints = extract_json_from_text(endpoints_text)
+    # Parse in a worker thread so large outputs don't block concurrent agent calls
+    endpoints = await asyncio.to_thread(extract_json_from_text, endpoints_text)
     
     if not endpoints:
         print(f"{Colors.YELLOW}Warning: Could not parse endpoints as JSON. Using default empty paths.{Colors.END}")
@@ -434,6 +701,65 @@ async def phase_3_endpoint_design(architecture: str) -> Dict:
     
     return endpoints
 
+def has_schemas(schemas: Any) -> bool:
+    """Check that an agent returned a non-empty schemas object"""
+    return isinstance(schemas, dict) and bool(schemas)
+
+def has_title(title_data: Any) -> bool:
+    """Check that an agent returned an info object with a non-empty title and description"""
+    return (
+        isinstance(title_data, dict)
+        and all(isinstance(title_data.get(field), str) and title_data[field].strip() for field in ("title", "description"))
+    )
+
+async def design_schemas(architecture: str, endpoints_digest: str) -> Optional[Dict]:
+    """Design the schemas using the Schema Designer Agent"""
+    # Create the Schema Designer Agent
+    schema_designer = create_schema_designer_agent()
+    
+    # Agent handoff message
+    print(f"\n{Colors.BOLD}{Colors.BLUE}🔄 Agent Handoff: Activating Schema Designer Agent{Colors.END}")
+    print(f"{Colors.BLUE}This agent specializes in designing data schemas with realistic example data.{Colors.END}")
+    
+    # Add schemas with examples using the Schema Designer Agent
+    schemas_user_prompt = f"""
+    Based on this API architecture and endpoints, design detailed schemas for all data models:
+    
+    {architecture}
+    
+    Endpoints (method, path, summary, parameters, response codes and referenced schemas):
+    {endpoints_digest}
+    
+    Create a complete 'schemas' object for the OpenAPI specification.
+    
+    CRITICAL: Every schema MUST include an 'example' property with realistic sample data that would be used in production.
+    """
+    
+    schemas_text = await cached_run(schema_designer, schemas_user_prompt, stream=True)
+    return await asyncio.to_thread(extract_json_from_text, schemas_text)
+
+async def extract_metadata(requirements: str) -> Optional[Dict]:
+    """Extract the API title and description using the Coordinator Agent"""
+    # Create the Coordinator Agent for metadata extraction
+    coordinator = create_coordinator_agent()
+    
+    # Agent handoff message
+    print(f"\n{Colors.BOLD}{Colors.BLUE}🔄 Agent Handoff: Activating Coordinator Agent for Metadata Extraction{Colors.END}")
+    print(f"{Colors.BLUE}The Coordinator is extracting API title and description from requirements.{Colors.END}")
+    
+    # Extract a title and description from the requirements using the Coordinator
+    title_user_prompt = f"""
+    Based on these requirements, provide a concise API title and description for an OpenAPI specification:
+    
+    {requirements}
+    
+    Respond in JSON format with 'title' and 'description' fields.
+    Wrap your JSON in ```json and ``` markers.
+    """
+    
+    title_text = await cached_run(coordinator, title_user_prompt)
+    return await asyncio.to_thread(extract_json_from_text, title_text)
+
 async def phase_4_documentation_generation(requirements: str, architecture: str, endpoints: Dict) -> Dict:
     """Phase 4: Documentation Generation using specialized agents"""
     print_section_header("Phase 4: Documentation Generation")
@@ -457,70 +783,68 @@ async def phase_4_documentation_generation(requirements: str, architecture: str,
     print(f"{Colors.BLUE}This phase uses multiple specialized agents to complete the API specification.{Colors.END}")
     
     # Start with the template
-    api_spec = API_SPEC_TEMPLATE.copy()
+    api_spec = new_api_spec()
     
     # Update with endpoints if available
-    if isinstance(endpoints, dict) and "paths" in endpoints:
+    if isinstance(endpoints, dict) and isinstance(endpoints.get("paths"), dict):
         api_spec["paths"] = endpoints["paths"]
     
-    # Create the Schema Designer Agent
-    schema_designer = create_schema_designer_agent()
+    # A compact digest keeps the full paths object (already saved to disk) out of the prompts
+    endpoints_digest = summarize_endpoints(endpoints)
+    
+    # Create the Finalizer Agent
+    finalizer = create_finalizer_agent()
     
     # Agent handoff message
-    print(f"\n{Colors.BOLD}{Colors.BLUE}🔄 Agent Handoff: Activating Schema Designer Agent{Colors.END}")
-    print(f"{Colors.BLUE}This agent specializes in designing data schemas with realistic example data.{Colors.END}")
+    print(f"\n{Colors.BOLD}{Colors.BLUE}🔄 Agent Handoff: Activating Finalizer Agent{Colors.END}")
+    print(f"{Colors.BLUE}This agent designs the schemas, API metadata and markdown documentation in a single pass.{Colors.END}")
     
-    # Add schemas with examples using the Schema Designer Agent
-    schemas_user_prompt = f"""
-    Based on this API architecture and endpoints, design detailed schemas for all data models:
+    finalizer_user_prompt = f"""
+    Complete the OpenAPI specification and documentation for this API.
     
-    {architecture}
+    Requirements:
+    {requirements}
     
-    Endpoints: {json.dumps(endpoints)}
+    Architecture:
+    {architecture}
     
-    Create a complete 'schemas' object for the OpenAPI specification.
+    Endpoints (method, path, summary, parameters, response codes and referenced schemas):
+    {endpoints_digest}
     
     CRITICAL: Every schema MUST include an 'example' property with realistic sample data that would be used in production.
+    Include multiple realistic examples for each endpoint in the documentation, showing both request and response.
     """
     
-    # Run the schema designer agent
-    result = await Runner.run(schema_designer, schemas_user_prompt)
-    schemas_text = result.final_output
-    
-    # Try to extract JSON from the response
-    schemas = extract_json_from_text(schemas_text)
-    
-    if schemas:
+    # One call replaces the separate schema, metadata and documentation requests
+    final_text = await cached_run(finalizer, finalizer_user_prompt, stream=True)
+    final_data = await asyncio.to_thread(extract_json_from_text, final_text)
+    
+    if not isinstance(final_data, dict):
+        final_data = {}
+    schemas = final_data.get("schemas")
+    title_data = final_data.get("info")
+    documentation = final_data.get("documentation_md")
+    
+    # Fall back to the specialized agents only for the fields the Finalizer Agent did not deliver,
+    # running them concurrently when both are needed - neither depends on the other
+    fallbacks = {}
+    if not has_schemas(schemas):
+        fallbacks["schemas"] = design_schemas(architecture, endpoints_digest)
+    if not has_title(title_data):
+        fallbacks["info"] = extract_metadata(requirements)
+    if fallbacks:
+        print(f"{Colors.YELLOW}The Finalizer Agent's response was incomplete. Falling back to the specialized agents.{Colors.END}")
+        results = dict(zip(fallbacks, await asyncio.gather(*fallbacks.values())))
+        schemas = results.get("schemas", schemas)
+        title_data = results.get("info", title_data)
+    
+    if has_schemas(schemas):
         api_spec["components"]["schemas"] = schemas
         print(f"{Colors.GREEN}Schemas designed successfully with examples!{Colors.END}")
     else:
         print(f"{Colors.YELLOW}Schemas were designed but not in valid JSON format. Using default schemas.{Colors.END}")
     
-    # Create the Coordinator Agent for metadata extraction
-    coordinator = create_coordinator_agent()
-    
-    # Agent handoff message
-    print(f"\n{Colors.BOLD}{Colors.BLUE}🔄 Agent Handoff: Activating Coordinator Agent for Metadata Extraction{Colors.END}")
-    print(f"{Colors.BLUE}The Coordinator is extracting API title and description from requirements.{Colors.END}")
-    
-    # Extract a title and description from the requirements using the Coordinator
-    title_user_prompt = f"""
-    Based on these requirements, provide a concise API title and description for an OpenAPI specification:
-    
-    {requirements}
-    
-    Respond in JSON format with 'title' and 'description' fields.
-    Wrap your JSON in ```json and ``` markers.
-    """
-    
-    # Run the coordinator agent
-    result = await Runner.run(coordinator, title_user_prompt)
-    title_text = result.final_output
-    
-    # Try to extract JSON from the response
-    title_data = extract_json_from_text(title_text)
-    
-    if title_data and "title" in title_data and "description" in title_data:
+    if has_title(title_data):
         api_spec["info"]["title"] = title_data["title"]
         api_spec["info"]["description"] = title_data["description"]
     else:
@@ -538,14 +862,18 @@ async def phase_4_documentation_generation(requirements: str, architecture: str,
     # Add terms of service
     api_spec["info"]["termsOfService"] = "https://example.com/terms"
     
-    # Note: The save_openapi_spec function will be called by the schema designer agent through the function_tool decorator
+    # Note: The save_openapi_spec function may be called by the schema designer agent through the function_tool decorator
     # We're keeping this manual save as a backup in case the tool wasn't called
-    save_to_file(api_spec, "openapi_specification.json")
+    await asyncio.to_thread(save_to_file, api_spec, "openapi_specification.json")
     
-    # Generate comprehensive markdown documentation
-    print(f"\n{Colors.BOLD}{Colors.BLUE}🔄 Agent Handoff: Schema Designer Agent → Documentation Agent{Colors.END}")
-    print(f"{Colors.BLUE}This agent specializes in generating comprehensive markdown documentation.{Colors.END}")
-    await generate_markdown_documentation(requirements, architecture, api_spec)
+    if isinstance(documentation, str) and documentation.strip():
+        await asyncio.to_thread(save_text_to_file, documentation, "api_documentation.md")
+        print(f"{Colors.GREEN}Comprehensive documentation generated and saved to api_documentation.md{Colors.END}")
+    else:
+        # Generate comprehensive markdown documentation
+        print(f"\n{Colors.BOLD}{Colors.BLUE}🔄 Agent Handoff: Finalizer Agent → Documentation Agent{Colors.END}")
+        print(f"{Colors.BLUE}This agent specializes in generating comprehensive markdown documentation.{Colors.END}")
+        await generate_markdown_documentation(requirements, architecture, api_spec)
     
     return api_spec
 
@@ -556,6 +884,25 @@ async def generate_markdown_documentation(requirements: str, architecture: str,
     # Create the Documentation Agent
     documentation_agent = create_documentation_agent()
     
+    # Send only an index of the spec; the agent fetches endpoint and schema details through its tools
+    global current_api_spec
+    current_api_spec = api_spec
+    servers = ", ".join(server["url"] for server in api_spec.get("servers", []))
+    security_schemes = ", ".join(
+        f"{name} ({scheme.get('scheme', scheme.get('type', ''))})"
+        for name, scheme in api_spec.get("components", {}).get("securitySchemes", {}).items()
+    ) or "none"
+    schemas = (api_spec.get("components") or {}).get("schemas") or {}
+    schema_names = ", ".join(schemas) or "none"
+    
+    # Each detail lookup can take a model turn, so allow one per operation and schema on top of the default
+    paths = api_spec.get("paths") or {}
+    operation_count = sum(
+        len([method for method in operations if method.lower() in HTTP_METHODS])
+        for operations in paths.values() if isinstance(operations, dict)
+    )
+    max_turns = DEFAULT_MAX_TURNS + operation_count + len(schemas)
+    
     # Generate documentation
     user_prompt = f"""
     Create comprehensive markdown documentation for this API:
@@ -566,16 +913,44 @@ async def generate_markdown_documentation(requirements: str, architecture: str,
     Architecture:
     {architecture}
     
-    OpenAPI Specification:
-    {json.dumps(api_spec, indent=2)}
+    API: {api_spec["info"]["title"]} - {api_spec["info"]["description"]}
+    Servers: {servers}
+    Security schemes: {security_schemes}
+    Schemas: {schema_names}
+    
+    Endpoints:
+    {summarize_endpoints(api_spec)}
     
     Include multiple realistic examples for each endpoint, showing both request and response.
     Document common use cases and best practices for using the API.
     """
     
     # Run the documentation agent
-    result = await Runner.run(documentation_agent, user_prompt)
-    documentation = result.final_output
+    try:
+        documentation = await cached_run(documentation_agent, user_prompt, max_turns=max_turns)
+    except MaxTurnsExceeded:
+        print(f"{Colors.YELLOW}The Documentation Agent ran out of turns fetching details. Retrying with the full specification inline.{Colors.END}")
+        
+        # Serialize the spec in a worker thread so the event loop stays free for other agent calls
+        api_spec_json = await asyncio.to_thread(orjson.dumps, api_spec, option=orjson.OPT_INDENT_2)
+        
+        inline_user_prompt = f"""
+        Create comprehensive markdown documentation for this API:
+        
+        Requirements:
+        {requirements}
+        
+        Architecture:
+        {architecture}
+        
+        OpenAPI Specification:
+        {api_spec_json.decode()}
+        
+        The full specification is included above, so there is no need to fetch endpoint or schema details.
+        Include multiple realistic examples for each endpoint, showing both request and response.
+        Document common use cases and best practices for using the API.
+        """
+        documentation = await cached_run(documentation_agent, inline_user_prompt)
     
     # Note: The save_documentation function will be called by the documentation agent through the function_tool decorator
     # We don't need to manually save the documentation here
@@ -591,90 +966,94 @@ async def main():
         print(f"Please set your API key with: {Colors.BOLD}export OPENAI_API_KEY=your_api_key_here{Colors.END}")
         return
     
-    # Print welcome message
-    print(f"\n{Colors.BOLD}{Colors.HEADER}=== Enhanced API Specification Generator (SDK Version) ==={Colors.END}\n")
-    print("This tool will help you create a detailed REST API specification with best practices guidance.")
-    print("You'll be guided through each phase of the API design process using specialized AI agents.\n")
-    
-    # Create the Coordinator Agent to guide the process
-    coordinator = create_coordinator_agent()
-    
-    # Agent activation message
-    print(f"\n{Colors.BOLD}{Colors.BLUE}🔄 Agent Activated: Coordinator Agent{Colors.END}")
-    print(f"{Colors.BLUE}This agent orchestrates the entire process, providing guidance and feedback at each step.{Colors.END}")
-    
-    # Get user input for the API to design
-    print(f"{Colors.YELLOW}Please describe the API you want to create (purpose, main features, etc.):{Colors.END}")
-    user_input = input("> ")
-    
-    # Get initial guidance from the coordinator
-    print(f"\n{Colors.CYAN}Getting process guidance from the Coordinator Agent...{Colors.END}")
-    guidance_prompt = f"The user wants to create an API for: {user_input}\n\nProvide a brief overview of the API design process we're about to start and any initial recommendations based on the user's request."
-    
-    # Run the coordinator agent
-    result = await Runner.run(coordinator, guidance_prompt)
-    guidance = result.final_output
-    
-    print(f"\n{Colors.CYAN}Coordinator's Guidance:{Colors.END}")
-    print(guidance)
-    
-    print(f"\n{Colors.GREEN}Starting the API specification generation process...{Colors.END}")
-    
-    # Run each phase
-    requirements = await phase_1_requirements_gathering(user_input)
-    
-    # Get coordinator feedback after requirements gathering
-    req_feedback_prompt = f"The requirements gathering phase has completed with these requirements:\n\n{requirements}\n\nPlease provide feedback on these requirements and suggestions for the architecture design phase."
-    
-    # Run the coordinator agent
-    result = await Runner.run(coordinator, req_feedback_prompt)
-    req_feedback = result.final_output
-    
-    print(f"\n{Colors.CYAN}Coordinator's Feedback on Requirements:{Colors.END}")
-    print(req_feedback)
-    
-    # Continue with architecture design
-    architecture = await phase_2_architecture_design(requirements)
-    
-    # Get coordinator feedback after architecture design
-    arch_feedback_prompt = f"The architecture design phase has completed with this architecture:\n\n{architecture}\n\nPlease provide feedback on this architecture and suggestions for the endpoint design phase."
-    
-    # Run the coordinator agent
-    result = await Runner.run(coordinator, arch_feedback_prompt)
-    arch_feedback = result.final_output
-    
-    print(f"\n{Colors.CYAN}Coordinator's Feedback on Architecture:{Colors.END}")
-    print(arch_feedback)
-    
-    # Continue with endpoint design
-    endpoints = await phase_3_endpoint_design(architecture)
-    
-    # Get coordinator feedback after endpoint design
-    endpoint_feedback_prompt = f"The endpoint design phase has completed. Please provide suggestions for the documentation generation phase."
-    
-    # Run the coordinator agent
-    result = await Runner.run(coordinator, endpoint_feedback_prompt)
-    endpoint_feedback = result.final_output
-    
-    print(f"\n{Colors.CYAN}Coordinator's Feedback on Endpoints:{Colors.END}")
-    print(endpoint_feedback)
-    
-    # Continue with documentation generation
-    api_spec = await phase_4_documentation_generation(requirements, architecture, endpoints)
-    
-    # Final message from the coordinator
-    final_prompt = "The API specification generation process has completed. Please provide a summary of what was created and any final recommendations for the user."
-    
-    # Run the coordinator agent
-    result = await Runner.run(coordinator, final_prompt)
-    final_message = result.final_output
-    
-    print(f"\n{Colors.CYAN}Coordinator's Final Message:{Colors.END}")
-    print(final_message)
-    
-    print(f"\n{Colors.GREEN}{Colors.BOLD}API specification generation complete!{Colors.END}")
-    print(f"OpenAPI Specification: {Colors.UNDERLINE}openapi_specification.json{Colors.END}")
-    print(f"API Documentation: {Colors.UNDERLINE}api_documentation.md{Colors.END}")
+    # Share one pooled HTTP/2 connection across every agent call instead of reconnecting per request
+    async with httpx.AsyncClient(http2=True, limits=httpx.Limits(max_keepalive_connections=20)) as http_client:
+        set_default_openai_client(AsyncOpenAI(api_key=api_key, http_client=http_client))
+        
+        # Print welcome message
+        print(f"\n{Colors.BOLD}{Colors.HEADER}=== Enhanced API Specification Generator (SDK Version) ==={Colors.END}\n")
+        print("This tool will help you create a detailed REST API specification with best practices guidance.")
+        print("You'll be guided through each phase of the API design process using specialized AI agents.\n")
+        
+        # Create the Coordinator Agent to guide the process. It has no tools, so its feedback
+        # can run alongside the next phase without overwriting that phase's output files.
+        coordinator = create_feedback_coordinator_agent()
+        
+        # Agent activation message
+        print(f"\n{Colors.BOLD}{Colors.BLUE}🔄 Agent Activated: Coordinator Agent{Colors.END}")
+        print(f"{Colors.BLUE}This agent orchestrates the entire process, providing guidance and feedback at each step.{Colors.END}")
+        
+        # Get user input for the API to design
+        print(f"{Colors.YELLOW}Please describe the API you want to create (purpose, main features, etc.):{Colors.END}")
+        user_input = input("> ")
+        
+        # Get initial guidance from the coordinator
+        print(f"\n{Colors.CYAN}Getting process guidance from the Coordinator Agent...{Colors.END}")
+        guidance_prompt = f"The user wants to create an API for: {user_input}\n\nProvide a brief overview of the API design process we're about to start and any initial recommendations based on the user's request."
+        
+        # Run the coordinator agent
+        guidance = await cached_run(coordinator, guidance_prompt)
+        
+        print(f"\n{Colors.CYAN}Coordinator's Guidance:{Colors.END}")
+        print(guidance)
+        
+        print(f"\n{Colors.GREEN}Starting the API specification generation process...{Colors.END}")
+        
+        # Run each phase
+        requirements = await phase_1_requirements_gathering(user_input)
+        
+        # Get coordinator feedback after requirements gathering
+        req_feedback_prompt = f"The requirements gathering phase has completed with these requirements:\n\n{requirements}\n\nPlease provide feedback on these requirements and suggestions for the architecture design phase."
+        
+        # The feedback is only displayed, so run the coordinator alongside the architecture design
+        architecture, req_feedback = await asyncio.gather(
+            phase_2_architecture_design(requirements),
+            cached_run(coordinator, req_feedback_prompt, run_config=FEEDBACK_RUN_CONFIG)
+        )
+        
+        print(f"\n{Colors.CYAN}Coordinator's Feedback on Requirements:{Colors.END}")
+        print(req_feedback)
+        
+        # Get coordinator feedback after architecture design
+        arch_feedback_prompt = f"The architecture design phase has completed with this architecture:\n\n{architecture}\n\nPlease provide feedback on this architecture and suggestions for the endpoint design phase."
+        
+        # Run the coordinator agent alongside the endpoint design
+        endpoints, arch_feedback = await asyncio.gather(
+            phase_3_endpoint_design(architecture),
+            cached_run(coordinator, arch_feedback_prompt, run_config=FEEDBACK_RUN_CONFIG)
+        )
+        
+        print(f"\n{Colors.CYAN}Coordinator's Feedback on Architecture:{Colors.END}")
+        print(arch_feedback)
+        
+        # Get coordinator feedback after endpoint design
+        endpoint_feedback_prompt = f"The endpoint design phase has completed. Please provide suggestions for the documentation generation phase."
+        
+        # Run the coordinator agent alongside the documentation generation
+        api_spec, endpoint_feedback = await asyncio.gather(
+            phase_4_documentation_generation(requirements, architecture, endpoints),
+            cached_run(coordinator, endpoint_feedback_prompt, run_config=FEEDBACK_RUN_CONFIG)
+        )
+        
+        print(f"\n{Colors.CYAN}Coordinator's Feedback on Endpoints:{Colors.END}")
+        print(endpoint_feedback)
+        
+        # Final message from the coordinator
+        final_prompt = "The API specification generation process has completed. Please provide a summary of what was created and any final recommendations for the user."
+        
+        # Run the coordinator agent
+        final_message = await cached_run(coordinator, final_prompt, run_config=FEEDBACK_RUN_CONFIG)
+        
+        print(f"\n{Colors.CYAN}Coordinator's Final Message:{Colors.END}")
+        print(final_message)
+        
+        print(f"\n{Colors.GREEN}{Colors.BOLD}API specification generation complete!{Colors.END}")
+        print(f"OpenAPI Specification: {Colors.UNDERLINE}openapi_specification.json{Colors.END}")
+        print(f"API Documentation: {Colors.UNDERLINE}api_documentation.md{Colors.END}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enhanced API Specification Generator (SDK Version)")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of reusing cached agent responses")
+    args = parser.parse_args()
+    response_cache_enabled = not args.no_cache
     asyncio.run(main())